@@ -18,13 +18,19 @@ Author: AD Sensor Stack Development
 
 """
 
-import csv
-import random
 import math
 import time
+from contextlib import contextmanager
 from enum import Enum
 from datetime import datetime
 
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from numba import njit, prange
+
 class TargetClass(Enum):
     """Target classification for radar detections."""
     VEHICLE = "vehicle"
@@ -51,6 +57,7 @@ RCS_MAX = 30.0     # dBsm
 
 NUM_FRAMES = 100
 FRAME_PERIOD = 0.1  # seconds
+SEED = 42           # random generator seed, makes runs reproducible
 
 NOISE_STD_RANGE = 0.1
 NOISE_STD_ANGLE = 0.1
@@ -73,177 +80,304 @@ MULTIPATH_PROB = 0.15
 CLUTTER_DENSITY = 0.02
 GROUND_CLUTTER_RANGE = 2.0
 
-class Target:
-    """Represents a radar target with realistic motion and detection characteristics."""
-    def __init__(self, target_id, target_class, initial_range, angle, velocity, rcs, is_static=True):
-        self.target_id = target_id
-        self.target_class = target_class
-        self.range = initial_range
-        self.angle = angle
-        self.velocity = velocity
-        self.rcs = rcs
-        self.is_static = is_static
-        self.track_quality = 1.0
-        self.age = 0
-        self.acceleration = 0.0
-        self.angular_velocity = 0.0
-
-    def update(self, dt):
-        """Update target position and motion for the next time step."""
-        if not self.is_static:
-            self.velocity += self.acceleration * dt
-            self.range += self.velocity * dt
-            self.angle += self.angular_velocity * dt
-            self.acceleration += random.gauss(0, 0.5)
-            self.angular_velocity += random.gauss(0, 0.1)
-            self.velocity = max(VEL_MIN, min(VEL_MAX, self.velocity))
-            self.angle = max(ANGLE_MIN, min(ANGLE_MAX, self.angle))
-            self.range = max(RANGE_MIN, min(RANGE_MAX, self.range))
-        self.age += 1
-
-    def get_detection_probability(self):
-        """Calculate the probability that this target will be detected by the radar."""
-        range_factor = math.exp(-RANGE_DECAY_FACTOR * self.range)
-        rcs_factor = max(0, (self.rcs - RCS_THRESHOLD) / (RCS_MAX - RCS_THRESHOLD))
-        return DETECTION_PROB_BASE * range_factor * rcs_factor
-
-def generate_ground_clutter():
-    """Generate realistic ground clutter points."""
-    clutter_points = []
-    num_clutter = int(CLUTTER_DENSITY * 100)
-    for _ in range(num_clutter):
-        range_clutter = random.uniform(2.0, 10.0)
-        angle_clutter = random.uniform(ANGLE_MIN, ANGLE_MAX)
-        rcs_clutter = random.uniform(-15.0, -5.0)
-        clutter_points.append({
-            'range': range_clutter,
-            'angle': angle_clutter,
-            'rcs': rcs_clutter,
-            'is_clutter': True
-        })
-    return clutter_points
-
-def add_multipath_effects(targets):
-    """Add multipath reflection effects for moving targets."""
-    multipath_targets = []
-    for target in targets:
-        if random.random() < MULTIPATH_PROB and not target.is_static:
-            multipath_range = target.range + random.uniform(5.0, 15.0)
-            multipath_angle = target.angle + random.uniform(-5.0, 5.0)
-            multipath_rcs = target.rcs - random.uniform(5.0, 10.0)
-            multipath_targets.append({
-                'range': multipath_range,
-                'angle': multipath_angle,
-                'rcs': multipath_rcs,
-                'is_multipath': True
-            })
-    return multipath_targets
+# =============================================================================
+# OUTPUT PARAMETERS
+# =============================================================================
+
+OUTPUT_FORMAT = 'parquet'  # 'parquet' (zstd compressed), 'feather' or 'csv'
+FRAMES_PER_BATCH = 4096    # frames whose detections are sampled together
+ROWS_PER_WRITE = 65_536    # rows buffered before each write (one Parquet row group)
+
+# Dictionary-encoded string columns store int8 indices into these value lists
+TARGET_CLASSES = [target_class.value for target_class in TargetClass] + ['clutter', 'multipath']
+SOURCES = ['target', 'clutter', 'multipath']
+DICTIONARIES = {'target_class': TARGET_CLASSES, 'source': SOURCES}
+
+SCHEMA = pa.schema([
+    ('timestamp', pa.float64()),
+    ('frame', pa.int64()),
+    ('target_id', pa.int64()),
+    ('range_m', pa.float32()),
+    ('angle_deg', pa.float32()),
+    ('radial_velocity_mps', pa.float32()),
+    ('rcs_dbsm', pa.float32()),
+    ('is_static', pa.bool_()),
+    ('target_class', pa.dictionary(pa.int8(), pa.string())),
+    ('track_quality', pa.float32()),
+    ('age', pa.int64()),
+    ('is_clutter', pa.bool_()),
+    ('is_multipath', pa.bool_()),
+    ('source', pa.dictionary(pa.int8(), pa.string())),
+])
+# Clutter and multipath rows get target_id = (frame + 1) * SPURIOUS_ID_STRIDE + index,
+# numbering the frame's clutter candidates first and its multipath candidates after
+# them, which keeps them clear of real target IDs and of each other
+SPURIOUS_ID_STRIDE = 10_000
+# Decimal places of float columns in CSV output; binary formats keep full precision
+CSV_DECIMALS = {'timestamp': 3}
+CSV_DEFAULT_DECIMALS = 2
+# CSV writes booleans as True/False strings, as the original csv.writer output did
+CSV_SCHEMA = pa.schema([
+    pa.field(field.name, pa.string()) if pa.types.is_boolean(field.type) else field
+    for field in SCHEMA
+])
+
+@njit(parallel=True, cache=True, fastmath=True)
+def simulate_all(ranges, angles, velocities, accelerations, angular_velocities, rcs,
+                 is_static, noise, dt, out_range, out_angle, out_vel, out_p_det):
+    """Advance all targets through every frame, recording per-frame state and detection probability.
+
+    Targets move independently of each other, so they are spread across threads
+    while each one steps through the frames sequentially.
+    """
+    num_frames, num_targets = out_range.shape
+    for i in prange(num_targets):
+        target_range = ranges[i]
+        angle = angles[i]
+        velocity = velocities[i]
+        acceleration = accelerations[i]
+        angular_velocity = angular_velocities[i]
+        rcs_factor = max(0.0, (rcs[i] - RCS_THRESHOLD) / (RCS_MAX - RCS_THRESHOLD))
+        for f in range(num_frames):
+            if not is_static[i]:
+                velocity += acceleration * dt
+                target_range += velocity * dt
+                angle += angular_velocity * dt
+                acceleration += noise[f, i, 4]
+                angular_velocity += noise[f, i, 5]
+                velocity = max(VEL_MIN, min(VEL_MAX, velocity))
+                angle = max(ANGLE_MIN, min(ANGLE_MAX, angle))
+                target_range = max(RANGE_MIN, min(RANGE_MAX, target_range))
+            out_range[f, i] = target_range
+            out_angle[f, i] = angle
+            out_vel[f, i] = velocity
+            out_p_det[f, i] = DETECTION_PROB_BASE * math.exp(-RANGE_DECAY_FACTOR * target_range) * rcs_factor
+
+def generate_ground_clutter(rng, num_frames):
+    """Generate realistic ground clutter points as float32 (range, angle, rcs) arrays of shape (frames, n)."""
+    shape = (num_frames, int(CLUTTER_DENSITY * 100))
+    return (
+        rng.uniform(2.0, 10.0, shape).astype(np.float32, copy=False),
+        rng.uniform(ANGLE_MIN, ANGLE_MAX, shape).astype(np.float32, copy=False),
+        rng.uniform(-15.0, -5.0, shape).astype(np.float32, copy=False),
+    )
+
+def add_multipath_effects(rng, ranges, angles, rcs, is_static):
+    """Add multipath reflection effects for moving targets over (frames, targets) state arrays.
+
+    Returns (range, angle, rcs, reflected) arrays of the same shape; only entries
+    where reflected is True are multipath candidates.
+    """
+    shape = ranges.shape
+    reflected = (rng.random(shape) < MULTIPATH_PROB) & ~is_static
+    return (
+        ranges + rng.uniform(5.0, 15.0, shape).astype(np.float32, copy=False),
+        angles + rng.uniform(-5.0, 5.0, shape).astype(np.float32, copy=False),
+        rcs - rng.uniform(5.0, 10.0, shape).astype(np.float32, copy=False),
+        reflected,
+    )
+
+@contextmanager
+def open_detection_writer(path, output_format):
+    """Open an incremental writer for detection tables in the requested format."""
+    if output_format == 'parquet':
+        with pq.ParquetWriter(path, SCHEMA, compression='zstd') as writer:
+            yield writer
+    elif output_format == 'feather':
+        # Feather V2 is the Arrow IPC file format
+        with pa.ipc.new_file(path, SCHEMA, options=pa.ipc.IpcWriteOptions(compression='lz4')) as writer:
+            yield writer
+    elif output_format == 'csv':
+        # pyarrow always quotes the header row, so write a plain one ourselves. None of
+        # the string columns can contain a delimiter, so value quoting is skipped too.
+        with pa.OSFile(path, 'wb') as sink:
+            sink.write((','.join(SCHEMA.names) + '\n').encode())
+            write_options = pa_csv.WriteOptions(include_header=False, quoting_style='none')
+            with pa_csv.CSVWriter(sink, CSV_SCHEMA, write_options=write_options) as writer:
+                yield writer
+    else:
+        raise ValueError(f"unsupported output format: {output_format}")
+
+def write_detections(writer, batches, output_format):
+    """Write the buffered batches of detection column arrays as one table."""
+    arrays = []
+    for field in SCHEMA:
+        values = np.concatenate([batch[field.name] for batch in batches])
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.DictionaryArray.from_arrays(values, DICTIONARIES[field.name]))
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    table = pa.table(arrays, schema=SCHEMA)
+    if output_format == 'csv':
+        columns = []
+        for name, column in zip(table.column_names, table.columns):
+            if pa.types.is_floating(column.type):
+                column = pc.round(column, CSV_DECIMALS.get(name, CSV_DEFAULT_DECIMALS))
+            elif pa.types.is_boolean(column.type):
+                column = pc.if_else(column, 'True', 'False')
+            columns.append(column)
+        table = pa.table(columns, schema=CSV_SCHEMA)
+    writer.write_table(table)
 
 # =============================================================================
 # SCENARIO DEFINITION - Urban Environment with Multiple Target Types
 # =============================================================================
 
+# (target_id, target_class, range, angle, velocity, rcs, acceleration, angular_velocity)
 STATIC_TARGETS = [
-    Target(0, TargetClass.STATIC_OBJECT, 15.0, -20.0, 0.0, 12.0, True),
-    Target(1, TargetClass.STATIC_OBJECT, 30.0, 10.0, 0.0, 18.0, True),
-    Target(2, TargetClass.STATIC_OBJECT, 50.0, 0.0, 0.0, 25.0, True),
-    Target(3, TargetClass.STATIC_OBJECT, 80.0, 8.0, 0.0, 8.0, True),
+    (0, TargetClass.STATIC_OBJECT, 15.0, -20.0, 0.0, 12.0, 0.0, 0.0),
+    (1, TargetClass.STATIC_OBJECT, 30.0, 10.0, 0.0, 18.0, 0.0, 0.0),
+    (2, TargetClass.STATIC_OBJECT, 50.0, 0.0, 0.0, 25.0, 0.0, 0.0),
+    (3, TargetClass.STATIC_OBJECT, 80.0, 8.0, 0.0, 8.0, 0.0, 0.0),
 ]
 
 MOVING_TARGETS = [
-    Target(4, TargetClass.VEHICLE, 40.0, -10.0, -8.0, 15.0, False),
-    Target(5, TargetClass.BICYCLE, 60.0, 5.0, 5.0, 5.0, False),
+    (4, TargetClass.VEHICLE, 40.0, -10.0, -8.0, 15.0, -0.5, 0.0),
+    (5, TargetClass.BICYCLE, 60.0, 5.0, 5.0, 5.0, 0.0, 0.2),
 ]
 
-MOVING_TARGETS[0].acceleration = -0.5
-MOVING_TARGETS[1].angular_velocity = 0.2
+def make_target_state(static_targets, moving_targets):
+    """Build the struct-of-arrays target state table from the scenario definition."""
+    targets = static_targets + moving_targets
+    tid, cls, ranges, angles, velocities, rcs, accelerations, angular_velocities = zip(*targets)
+    return {
+        'range': np.array(ranges, dtype=np.float32),
+        'angle': np.array(angles, dtype=np.float32),
+        'velocity': np.array(velocities, dtype=np.float32),
+        'rcs': np.array(rcs, dtype=np.float32),
+        'acc': np.array(accelerations, dtype=np.float32),
+        'aw': np.array(angular_velocities, dtype=np.float32),
+        'is_static': np.array([True] * len(static_targets) + [False] * len(moving_targets)),
+        'track_quality': np.ones(len(targets), dtype=np.float32),
+        'tid': np.array(tid, dtype=np.int32),
+        'cls': np.array([TARGET_CLASSES.index(target_class.value) for target_class in cls], dtype=np.int8),
+    }
+
+state = make_target_state(STATIC_TARGETS, MOVING_TARGETS)
 
 # =============================================================================
 # DATA GENERATION
 # =============================================================================
 
+# Single PCG64 generator shared by every random draw in the simulation
+rng = np.random.default_rng(SEED)
+
+# Gaussian noise for every frame and target, drawn up front. Channels are the
+# range/angle/velocity/rcs measurement noise followed by the acceleration and
+# angular velocity process noise.
+noise_stds = np.array([NOISE_STD_RANGE, NOISE_STD_ANGLE, NOISE_STD_VEL, NOISE_STD_RCS, 0.5, 0.1],
+                      dtype=np.float32)
+noise = rng.standard_normal((NUM_FRAMES, len(state['range']), 6), dtype=np.float32)
+noise *= noise_stds
+
 # Create unique filename with timestamp
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-OUTPUT_CSV = f'data/raw/radar/synthetic_radar_data_{timestamp}.csv'
-
-with open(OUTPUT_CSV, 'w', newline='') as csvfile:
-    fieldnames = [
-        'timestamp', 'frame', 'target_id', 'range_m', 'angle_deg',
-        'radial_velocity_mps', 'rcs_dbsm', 'is_static', 'target_class',
-        'track_quality', 'age', 'is_clutter', 'is_multipath'
-    ]
-    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-    writer.writeheader()
-
-    start_time = time.time()
-    for frame in range(NUM_FRAMES):
-        timestamp = start_time + frame * FRAME_PERIOD
-        all_targets = STATIC_TARGETS + MOVING_TARGETS
-        for target in all_targets:
-            target.update(FRAME_PERIOD)
-        clutter_points = generate_ground_clutter()
-        multipath_points = add_multipath_effects(MOVING_TARGETS)
-        detections = []
-        for target in all_targets:
-            if random.random() < target.get_detection_probability():
-                noisy_range = target.range + random.gauss(0, NOISE_STD_RANGE)
-                noisy_angle = target.angle + random.gauss(0, NOISE_STD_ANGLE)
-                noisy_velocity = target.velocity + random.gauss(0, NOISE_STD_VEL)
-                noisy_rcs = target.rcs + random.gauss(0, NOISE_STD_RCS)
-                noisy_range = max(RANGE_MIN, min(RANGE_MAX, noisy_range))
-                noisy_angle = max(ANGLE_MIN, min(ANGLE_MAX, noisy_angle))
-                noisy_velocity = max(VEL_MIN, min(VEL_MAX, noisy_velocity))
-                noisy_rcs = max(RCS_MIN, min(RCS_MAX, noisy_rcs))
-                detections.append({
-                    'timestamp': round(timestamp, 3),
-                    'frame': frame,
-                    'target_id': target.target_id,
-                    'range_m': round(noisy_range, 2),
-                    'angle_deg': round(noisy_angle, 2),
-                    'radial_velocity_mps': round(noisy_velocity, 2),
-                    'rcs_dbsm': round(noisy_rcs, 2),
-                    'is_static': target.is_static,
-                    'target_class': target.target_class.value,
-                    'track_quality': round(target.track_quality, 2),
-                    'age': target.age,
-                    'is_clutter': False,
-                    'is_multipath': False
-                })
-        for i, clutter in enumerate(clutter_points):
-            if random.random() < 0.3:
-                detections.append({
-                    'timestamp': round(timestamp, 3),
-                    'frame': frame,
-                    'target_id': f'clutter_{frame}_{i}',
-                    'range_m': round(clutter['range'], 2),
-                    'angle_deg': round(clutter['angle'], 2),
-                    'radial_velocity_mps': 0.0,
-                    'rcs_dbsm': round(clutter['rcs'], 2),
-                    'is_static': True,
-                    'target_class': 'clutter',
-                    'track_quality': 0.1,
-                    'age': 0,
-                    'is_clutter': True,
-                    'is_multipath': False
-                })
-        for i, multipath in enumerate(multipath_points):
-            if random.random() < 0.7:
-                detections.append({
-                    'timestamp': round(timestamp, 3),
-                    'frame': frame,
-                    'target_id': f'multipath_{frame}_{i}',
-                    'range_m': round(multipath['range'], 2),
-                    'angle_deg': round(multipath['angle'], 2),
-                    'radial_velocity_mps': 0.0,
-                    'rcs_dbsm': round(multipath['rcs'], 2),
-                    'is_static': True,
-                    'target_class': 'multipath',
-                    'track_quality': 0.3,
-                    'age': 0,
-                    'is_clutter': False,
-                    'is_multipath': True
-                })
-        for detection in detections:
-            writer.writerow(detection)
-
-print(f"synthetic radar data written to {OUTPUT_CSV}")
\ No newline at end of file
+OUTPUT_FILE = f'data/raw/radar/synthetic_radar_data_{timestamp}.{OUTPUT_FORMAT}'
+
+# Target trajectories and detection probabilities for every frame, computed up front.
+# All simulation state is float32; the output only needs centimetre precision.
+out_shape = (NUM_FRAMES, len(state['range']))
+range_hist = np.empty(out_shape, dtype=np.float32)
+angle_hist = np.empty(out_shape, dtype=np.float32)
+vel_hist = np.empty(out_shape, dtype=np.float32)
+p_det_hist = np.empty(out_shape, dtype=np.float32)
+simulate_all(state['range'], state['angle'], state['velocity'], state['acc'], state['aw'], state['rcs'],
+             state['is_static'], noise, np.float32(FRAME_PERIOD),
+             range_hist, angle_hist, vel_hist, p_det_hist)
+
+# Targets below the RCS threshold are never detected; skip their detection draws
+detectable = np.flatnonzero((p_det_hist > 0).any(axis=0))
+
+# Timestamp of every frame, shared by all rows of that frame
+frame_timestamps = time.time() + FRAME_PERIOD * np.arange(NUM_FRAMES)
+
+# Dictionary codes of the target_class of clutter/multipath rows and of each source
+spurious_cls = np.array([TARGET_CLASSES.index('clutter'), TARGET_CLASSES.index('multipath')], dtype=np.int8)
+source_codes = np.arange(len(SOURCES), dtype=np.int8)
+# track_quality of clutter and multipath rows
+spurious_track_quality = np.array([0.1, 0.3], dtype=np.float32)
+
+# Column arrays of sampled batches, flushed once ROWS_PER_WRITE rows are buffered
+buffered = []
+buffered_rows = 0
+with open_detection_writer(OUTPUT_FILE, OUTPUT_FORMAT) as writer:
+    for start in range(0, NUM_FRAMES, FRAMES_PER_BATCH):
+        stop = min(start + FRAMES_PER_BATCH, NUM_FRAMES)
+        num_frames = stop - start
+
+        # Detection, clutter and multipath masks for this batch of frames
+        detected = np.zeros((num_frames, len(state['range'])), dtype=bool)
+        detected[:, detectable] = (rng.random((num_frames, detectable.shape[0]))
+                                   < p_det_hist[start:stop, detectable])
+        clutter_range, clutter_angle, clutter_rcs = generate_ground_clutter(rng, num_frames)
+        clutter = rng.random(clutter_range.shape) < 0.3
+        multipath_range, multipath_angle, multipath_rcs, reflected = add_multipath_effects(
+            rng, range_hist[start:stop], angle_hist[start:stop], state['rcs'], state['is_static'])
+        multipath = reflected & (rng.random(reflected.shape) < 0.7)
+        # Index of each multipath candidate within its frame, numbered after the frame's clutter
+        multipath_index = clutter_range.shape[1] + np.cumsum(reflected, axis=1) - 1
+
+        # Noisy target measurements for this batch of frames
+        batch_noise = noise[start:stop]
+        noisy_range = range_hist[start:stop] + batch_noise[:, :, 0]
+        noisy_angle = angle_hist[start:stop] + batch_noise[:, :, 1]
+        noisy_velocity = vel_hist[start:stop] + batch_noise[:, :, 2]
+        noisy_rcs = state['rcs'] + batch_noise[:, :, 3]
+        np.clip(noisy_range, RANGE_MIN, RANGE_MAX, out=noisy_range)
+        np.clip(noisy_angle, ANGLE_MIN, ANGLE_MAX, out=noisy_angle)
+        np.clip(noisy_velocity, VEL_MIN, VEL_MAX, out=noisy_velocity)
+        np.clip(noisy_rcs, RCS_MIN, RCS_MAX, out=noisy_rcs)
+
+        # Frame indices below are relative to the batch start
+        target_frame, target = np.nonzero(detected)
+        clutter_frame, clutter_point = np.nonzero(clutter)
+        multipath_frame, multipath_target = np.nonzero(multipath)
+
+        counts = [target.shape[0], clutter_point.shape[0], multipath_target.shape[0]]
+        num_spurious = counts[1] + counts[2]
+        frames = start + np.concatenate([target_frame, clutter_frame, multipath_frame])
+        columns = {
+            'timestamp': frame_timestamps[frames],
+            'frame': frames,
+            'target_id': np.concatenate([
+                state['tid'][target].astype(np.int64),
+                (start + clutter_frame + 1) * SPURIOUS_ID_STRIDE + clutter_point,
+                (start + multipath_frame + 1) * SPURIOUS_ID_STRIDE
+                + multipath_index[multipath_frame, multipath_target],
+            ]),
+            'range_m': np.concatenate([
+                noisy_range[target_frame, target],
+                clutter_range[clutter_frame, clutter_point],
+                multipath_range[multipath_frame, multipath_target],
+            ]),
+            'angle_deg': np.concatenate([
+                noisy_angle[target_frame, target],
+                clutter_angle[clutter_frame, clutter_point],
+                multipath_angle[multipath_frame, multipath_target],
+            ]),
+            'radial_velocity_mps': np.concatenate([
+                noisy_velocity[target_frame, target], np.zeros(num_spurious, dtype=np.float32)]),
+            'rcs_dbsm': np.concatenate([
+                noisy_rcs[target_frame, target],
+                clutter_rcs[clutter_frame, clutter_point],
+                multipath_rcs[multipath_frame, multipath_target],
+            ]),
+            'is_static': np.concatenate([state['is_static'][target], np.ones(num_spurious, dtype=bool)]),
+            'target_class': np.concatenate([state['cls'][target], np.repeat(spurious_cls, counts[1:])]),
+            'track_quality': np.concatenate([
+                state['track_quality'][target], np.repeat(spurious_track_quality, counts[1:])]),
+            'age': np.concatenate([start + target_frame + 1, np.zeros(num_spurious, dtype=np.int64)]),
+            'is_clutter': np.repeat([False, True, False], counts),
+            'is_multipath': np.repeat([False, False, True], counts),
+            'source': np.repeat(source_codes, counts),
+        }
+        # Within a frame, rows are ordered target detections, then clutter, then multipath
+        order = np.argsort(frames, kind='stable')
+        buffered.append({name: values[order] for name, values in columns.items()})
+        buffered_rows += frames.shape[0]
+        if buffered_rows >= ROWS_PER_WRITE or stop == NUM_FRAMES:
+            write_detections(writer, buffered, OUTPUT_FORMAT)
+            buffered.clear()
+            buffered_rows = 0
+
+print(f"synthetic radar data written to {OUTPUT_FILE}")